@@ -0,0 +1,56 @@
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit is open and calls are short-circuited."""
+
+
+class CircuitBreaker:
+    """
+    Minimal circuit breaker for the Gemini dependency.
+
+    After `threshold` consecutive transient failures the circuit opens and
+    callers fail fast for `cooldown_seconds` instead of burning backoff time
+    against an API that is down. Once the cooldown elapses the circuit lets
+    probe calls through again (half-open); the first success closes it.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown_seconds: float = 30.0):
+        self.threshold = threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        if self._opened_at is None:
+            return False
+        if time.monotonic() - self._opened_at >= self.cooldown_seconds:
+            # Cooldown elapsed: half-open, allow probe calls through.
+            return False
+        return True
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._failures >= self.threshold:
+            # Unconditionally (re)stamp the open time: failures are only
+            # recorded while the circuit is closed or half-open, so this is
+            # either the initial trip or a failed probe re-opening it for
+            # another cooldown.
+            logger.warning(
+                f"Circuit breaker opened after {self._failures} consecutive failures; "
+                f"failing fast for {self.cooldown_seconds:.0f}s"
+            )
+            self._opened_at = time.monotonic()
+
+
+# Shared breaker guarding all Gemini generation calls.
+gemini_breaker = CircuitBreaker()
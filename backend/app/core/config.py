@@ -10,9 +10,16 @@ class Settings(BaseSettings):
     # Concurrent Job Processing
     MAX_WORKERS: int = Field(4, description="Maximum number of concurrent background workers for job processing")
 
+    # Job Store (Redis)
+    REDIS_URL: str = Field("redis://localhost:6379/0", description="Redis connection URL for the shared job store")
+    JOB_EXPIRY_SECONDS: int = Field(3600, description="TTL for visualization jobs in Redis (seconds)")
+
     # Security
     CORS_ORIGINS: list[str] = ["http://localhost:5173", "http://localhost:3000"]
     
+    # Request Limits
+    MAX_QUESTION_LEN: int = Field(4000, description="Maximum allowed length of a visualization question")
+
     # Gemini Config
     GEMINI_API_KEY: str = Field(..., description="Get this from aistudio.google.com")
     GEMINI_MODEL: str = "gemini-2.5-flash" # Updated model for potentially better performance or features
@@ -0,0 +1,16 @@
+from functools import lru_cache
+
+from google import genai
+
+from app.core.config import settings
+
+
+@lru_cache(maxsize=1)
+def get_client() -> genai.Client:
+    """Returns the app-wide Gemini client, constructed on first use.
+
+    A single client means one HTTP connection pool (keep-alive, TLS session)
+    shared across all strategies, and the lru_cache defers construction so
+    merely importing a strategy module never builds the client.
+    """
+    return genai.Client(api_key=settings.GEMINI_API_KEY)
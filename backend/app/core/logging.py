@@ -0,0 +1,16 @@
+import logging
+
+from app.core.config import settings
+
+
+def setup_logging() -> None:
+    """Configure the root logger once, from settings.
+
+    Called from main.py at startup; individual modules should only do
+    `logger = logging.getLogger(__name__)` and never call basicConfig
+    themselves, so import order cannot change the logging configuration.
+    """
+    logging.basicConfig(
+        level=settings.LOG_LEVEL.upper(),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    )
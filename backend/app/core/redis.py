@@ -0,0 +1,7 @@
+import redis.asyncio as redis
+
+from app.core.config import settings
+
+# Shared async Redis client for the job store. Connections are created lazily,
+# so importing this module does not require Redis to be up yet.
+redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
@@ -1,31 +1,40 @@
 import asyncio
 import logging
+import random
+import time
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 from enum import Enum
 from typing import Dict, Any, Optional
 
-from fastapi import FastAPI, HTTPException, status
+import msgspec
+from fastapi import FastAPI, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field, field_validator
 
+from app.core.breaker import CircuitOpenError, gemini_breaker
 from app.core.config import settings
+from app.core.logging import setup_logging
+from app.core.redis import redis_client
 from app.services.llm_service import (
     check_gemini_connection,
     list_models,
     generate_visualization, # Updated import
     get_supported_visualization_types, # New import
+    is_supported_visualization_type,
 )
 from app.services.visualizations.visualization_strategy import VisualizationOptions, VisualizationResult # New import
 from google.genai import errors as genai_errors
 
-# Configure logging to show INFO level logs
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
+# Single place where the root logger gets configured (level comes from settings)
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title=settings.PROJECT_NAME)
+# orjson handles all remaining dict-returning endpoints faster than the
+# default json-based response class.
+app = FastAPI(title=settings.PROJECT_NAME, default_response_class=ORJSONResponse)
 
 # CORS is vital for React <-> FastAPI communication
 app.add_middleware(
@@ -44,9 +53,20 @@ class JobStatus(str, Enum):
     FAILED = "failed"
 
 
+# Translate table that deletes ASCII control characters from questions,
+# exempting tab/newline/carriage return so multi-line questions keep their
+# word boundaries.
+_CONTROL_CHARS = dict.fromkeys(
+    c for c in range(0x20) if c not in (0x09, 0x0A, 0x0D)
+)
+
+
 class VisualizationRequest(BaseModel):
     """Request body for creating a visualization job."""
-    question: str
+    question: str = Field(
+        ..., min_length=1, max_length=settings.MAX_QUESTION_LEN,
+        description="The question or topic to visualize"
+    )
     visualization_type: str = Field(
         "flowchart", description="Type of visualization to generate (e.g., 'flowchart', 'mindmap')"
     )
@@ -54,35 +74,111 @@ class VisualizationRequest(BaseModel):
         default_factory=VisualizationOptions, description="Options for visualization generation"
     )
 
-
-class VisualizationJobCreateResponse(BaseModel):
+    @field_validator("question")
+    @classmethod
+    def _strip_control_characters(cls, value: str) -> str:
+        """Drop control characters before the question reaches prompt building."""
+        value = value.translate(_CONTROL_CHARS)
+        # min_length ran before this validator, so re-check that something
+        # printable is left after stripping.
+        if not value.strip():
+            raise ValueError("question must contain printable characters")
+        return value
+
+
+# Internal job state and poll responses are plain data on a hot path; msgspec
+# Structs encode/decode several times faster than Pydantic models. The request
+# model stays Pydantic since FastAPI validates with it.
+class VisualizationJobCreateResponse(msgspec.Struct, kw_only=True):
     """Response body containing job ID and status upon job creation."""
     job_id: str
     status: JobStatus
 
 
-class VisualizationJob(BaseModel):
+class VisualizationJob(msgspec.Struct, kw_only=True):
     id: str
     status: JobStatus
     visualization_type: str
     content: Optional[str] = None
-    metadata: Dict[str, Any] = Field({})
+    metadata: Dict[str, Any] = msgspec.field(default_factory=dict)
     error: Optional[str] = None
     created_at: datetime
-    updated_at: datetime
-    expires_at: datetime # New field for job expiry
+    # Epoch seconds; cheaper to stamp than a datetime on every state change
+    updated_at_ts: float
     attempts: int = 0
 
 
-class VisualizationJobStatusResponse(BaseModel):
+class VisualizationJobStatusResponse(msgspec.Struct, kw_only=True):
     job_id: str
     status: JobStatus
     visualization_type: str
     content: Optional[str] = None
-    metadata: Dict[str, Any] = Field({})
+    metadata: Dict[str, Any] = msgspec.field(default_factory=dict)
     error: Optional[str] = None
-    
-_jobs: Dict[str, VisualizationJob] = {} # Updated type hint
+
+
+_JOB_DECODER = msgspec.json.Decoder(VisualizationJob)
+
+
+def _json_response(payload: msgspec.Struct) -> Response:
+    """Serialize a Struct straight to bytes, bypassing Pydantic/jsonable_encoder."""
+    return Response(content=msgspec.json.encode(payload), media_type="application/json")
+
+
+def _update_job(job: VisualizationJob, **changes: Any) -> None:
+    """Apply a batch of field changes to a job and stamp updated_at_ts once."""
+    for field, value in changes.items():
+        setattr(job, field, value)
+    job.updated_at_ts = time.time()
+
+
+def _job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+async def _store_job(job: VisualizationJob) -> None:
+    """Persist a job to Redis; the TTL makes expired jobs self-delete."""
+    await redis_client.set(
+        _job_key(job.id), msgspec.json.encode(job), ex=settings.JOB_EXPIRY_SECONDS
+    )
+
+
+async def _load_job(job_id: str) -> Optional[VisualizationJob]:
+    """Fetch a job from Redis; returns None if missing or expired."""
+    raw = await redis_client.get(_job_key(job_id))
+    if raw is None:
+        return None
+    return _JOB_DECODER.decode(raw)
+
+async def _worker() -> None:
+    """Queue consumer: runs visualization jobs one at a time until cancelled."""
+    while True:
+        payload = await app.state.job_queue.get()
+        try:
+            await _run_visualization_job(**payload)
+        except Exception:  # pragma: no cover - defensive guardrail
+            logger.exception("Worker failed while running a visualization job")
+        finally:
+            app.state.job_queue.task_done()
+
+
+@app.on_event("startup")
+async def start_workers() -> None:
+    """Create the bounded job queue and the fixed pool of consumer tasks."""
+    app.state.job_queue = asyncio.Queue(maxsize=settings.MAX_WORKERS * 4)
+    app.state.worker_tasks = [
+        asyncio.create_task(_worker()) for _ in range(settings.MAX_WORKERS)
+    ]
+    logger.info(f"Started {settings.MAX_WORKERS} visualization workers")
+
+
+@app.on_event("shutdown")
+async def stop_workers() -> None:
+    """Cancel worker tasks and wait for them to unwind."""
+    for task in app.state.worker_tasks:
+        task.cancel()
+    await asyncio.gather(*app.state.worker_tasks, return_exceptions=True)
+
 
 @app.get("/health")
 async def health_check():
@@ -109,51 +205,67 @@ async def get_supported_types_endpoint():
 
 
 async def _run_visualization_job(
-    job_id: str,
+    job: VisualizationJob,
     question: str,
     visualization_type: str,
     options: VisualizationOptions,
 ) -> None:
-    """Background task that calls Gemini with retry and updates job state."""
+    """Background task that calls Gemini with retry and updates job state.
+
+    The job object is handed over directly from the enqueueing request, so
+    there is no need to read back from Redis what was just written; field
+    mutations are batched into a single store per state transition.
+    """
+    job_id = job.id
     logger.info(f"[JOB {job_id}] Starting background task for visualization type: {visualization_type}")
-    job = _jobs.get(job_id)
-    if not job:
-        logger.warning(f"[JOB {job_id}] Attempted to run non-existent job")
-        return
 
     max_attempts = 3
     base_delay_seconds = 1.5
+    max_backoff_seconds = 30.0
 
     for attempt in range(1, max_attempts + 1):
         logger.info(f"[JOB {job_id}] Attempt {attempt}/{max_attempts}")
-        job.status = JobStatus.RUNNING
-        job.attempts = attempt
-        job.updated_at = datetime.utcnow()
-        _jobs[job_id] = job
+        _update_job(job, status=JobStatus.RUNNING, attempts=attempt)
+        await _store_job(job)
 
         try:
             logger.info(f"[JOB {job_id}] Calling generate_visualization...")
             result: VisualizationResult = await generate_visualization(
                 question, visualization_type, options
             )
+            # One cooperative yield so a burst of completing jobs lets the
+            # scheduler service queued /visualize/{job_id} polls first.
+            await asyncio.sleep(0)
             logger.info(f"[JOB {job_id}] Visualization generated successfully!")
-            job.content = result.content
-            job.metadata = result.metadata
-            job.status = JobStatus.SUCCEEDED
-            job.updated_at = datetime.utcnow()
-            _jobs[job_id] = job
+            _update_job(
+                job,
+                status=JobStatus.SUCCEEDED,
+                content=result.content,
+                metadata=result.metadata,
+            )
+            await _store_job(job)
             logger.info(f"[JOB {job_id}] Job completed successfully")
             return
+        except CircuitOpenError:
+            logger.warning(f"[JOB {job_id}] Gemini circuit open; failing fast")
+            _update_job(
+                job,
+                status=JobStatus.FAILED,
+                error=(
+                    "Gemini is temporarily unavailable. "
+                    "Please wait a moment and try again."
+                ),
+            )
+            await _store_job(job)
+            return
         except (ValueError, RuntimeError) as exc:
             # Catch specific errors from visualization strategies or LLM service
             logger.exception(
                 f"[JOB {job_id}] Visualization generation failed "
                 f"(type={visualization_type}, attempt={attempt}/{max_attempts}): {exc}"
             )
-            job.status = JobStatus.FAILED
-            job.error = str(exc)
-            job.updated_at = datetime.utcnow()
-            _jobs[job_id] = job
+            _update_job(job, status=JobStatus.FAILED, error=str(exc))
+            await _store_job(job)
             return
         except genai_errors.ServerError as exc:
             # Try to robustly determine the HTTP status code from the exception.
@@ -181,67 +293,84 @@ async def _run_visualization_job(
 
             # Retry on transient service or throttling errors only, with backoff.
             if status_code in (503, 429) and attempt < max_attempts:
-                delay = base_delay_seconds * (2 ** (attempt - 1))
+                # Equal jitter: concurrent jobs hitting the same 429/503 wake up
+                # spread out instead of re-stampeding the API in lockstep.
+                delay = min(
+                    max_backoff_seconds, base_delay_seconds * (2 ** (attempt - 1))
+                ) * (0.5 + random.random() * 0.5)
+                # Honor a server-provided Retry-After hint if it is larger.
+                retry_after = getattr(
+                    getattr(exc, "response", None), "headers", {}
+                ).get("Retry-After")
+                if retry_after is not None:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except (TypeError, ValueError):
+                        pass
                 logger.warning(f"[JOB {job_id}] Retrying after {delay:.1f}s due to status {status_code}")
-                job.status = JobStatus.PENDING # Temporarily set to PENDING for retry
-                job.error = f"Transient Gemini error (status={status_code}). Retrying in {delay:.1f}s."
-                job.updated_at = datetime.utcnow()
-                _jobs[job_id] = job
+                _update_job(
+                    job,
+                    status=JobStatus.PENDING, # Temporarily set to PENDING for retry
+                    error=f"Transient Gemini error (status={status_code}). Retrying in {delay:.1f}s.",
+                )
+                await _store_job(job)
                 await asyncio.sleep(delay)
                 continue
 
-            job.status = JobStatus.FAILED
             # User-friendly error message while still logging the raw exception above.
             if status_code == 503:
-                job.error = (
+                error = (
                     "The Gemini model is still overloaded after multiple attempts. "
                     "Please wait a bit and try again."
                 )
             elif status_code == 429:
-                job.error = (
+                error = (
                     "Gemini rate limit was hit several times in a row. "
                     "Please slow down and try again shortly."
                 )
             else:
-                job.error = f"Gemini returned an error while generating the diagram: {exc}"
-            job.updated_at = datetime.utcnow()
-            _jobs[job_id] = job
+                error = f"Gemini returned an error while generating the diagram: {exc}"
+            _update_job(job, status=JobStatus.FAILED, error=error)
+            await _store_job(job)
             return
         except Exception as exc:  # pragma: no cover - defensive guardrail
             logger.exception(
                 f"[JOB {job_id}] Unexpected error "
                 f"(attempt={attempt}/{max_attempts}): {exc}"
             )
-            job.status = JobStatus.FAILED
-            job.error = f"Unexpected error: {exc}"
-            job.updated_at = datetime.utcnow()
-            _jobs[job_id] = job
+            _update_job(job, status=JobStatus.FAILED, error=f"Unexpected error: {exc}")
+            await _store_job(job)
             return
 
 
-@app.post("/visualize", response_model=VisualizationJobCreateResponse)
-async def visualize(request: VisualizationRequest) -> VisualizationJobCreateResponse:
+@app.post("/visualize")
+async def visualize(request: VisualizationRequest) -> Response:
     """Create an asynchronous visualization job.
 
     The frontend should poll `/visualize/{job_id}` to retrieve the final diagram
     or any error that occurred.
     """
     logger.info(f"Received visualization request: type={request.visualization_type}, question='{request.question[:100]}...'")
+    # Fail fast while the Gemini circuit is open; accepting the job would only
+    # have a worker discover the same outage seconds later.
+    if gemini_breaker.is_open:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Gemini is temporarily unavailable. Please retry shortly.",
+            headers={"Retry-After": "30"},
+        )
     # Validate requested visualization type
-    supported_types = get_supported_visualization_types()
-    if request.visualization_type.lower() not in supported_types:
+    if not is_supported_visualization_type(request.visualization_type):
         logger.warning(f"Unsupported visualization type requested: {request.visualization_type}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Unsupported visualization type: '{request.visualization_type}'. "
-                   f"Supported types are: {', '.join(supported_types)}."
+                   f"Supported types are: {', '.join(get_supported_visualization_types())}."
         )
 
     job_id = str(uuid.uuid4())
     logger.info(f"Created job {job_id} for {request.visualization_type} visualization")
-    now = datetime.utcnow()
-    # Jobs expire after 1 hour (settings.JOB_EXPIRY_SECONDS could be used)
-    expires_at = now + timedelta(seconds=3600) 
+    now = datetime.now(timezone.utc)
 
     job = VisualizationJob(
         id=job_id,
@@ -251,54 +380,58 @@ async def visualize(request: VisualizationRequest) -> VisualizationJobCreateResp
         metadata={},
         error=None,
         created_at=now,
-        updated_at=now,
-        expires_at=expires_at,
+        updated_at_ts=time.time(),
         attempts=0,
     )
-    _jobs[job_id] = job
-
-    # Fire-and-forget background task
-    asyncio.create_task(
-        _run_visualization_job(
-            job_id,
-            request.question,
-            request.visualization_type,
-            request.options,
+    # The Redis TTL (settings.JOB_EXPIRY_SECONDS) handles job expiry
+    await _store_job(job)
+
+    # Hand the job to the bounded worker pool; reject with 503 when saturated
+    # so clients back off instead of piling unbounded work onto the queue.
+    try:
+        app.state.job_queue.put_nowait(
+            {
+                "job": job,
+                "question": request.question,
+                "visualization_type": request.visualization_type,
+                "options": request.options,
+            }
+        )
+    except asyncio.QueueFull:
+        logger.warning(f"Job queue full; rejecting job {job_id}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy processing visualizations. Please retry shortly.",
+            headers={"Retry-After": "5"},
         )
-    )
 
-    return VisualizationJobCreateResponse(job_id=job_id, status=JobStatus.PENDING)
+    return _json_response(
+        VisualizationJobCreateResponse(job_id=job_id, status=JobStatus.PENDING)
+    )
 
 
-@app.get("/visualize/{job_id}", response_model=VisualizationJobStatusResponse)
-async def get_visualization_job(job_id: str) -> VisualizationJobStatusResponse:
+@app.get("/visualize/{job_id}")
+async def get_visualization_job(job_id: str) -> Response:
     """Retrieve the status and result (if ready) of a visualization job."""
-    job = _jobs.get(job_id)
+    job = await _load_job(job_id)
     if not job:
-        logger.debug(f"[JOB {job_id}] Job not found in memory")
+        logger.debug(f"[JOB {job_id}] Job not found in Redis (missing or expired)")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail={"message": f"Visualization job '{job_id}' not found or expired."},
         )
-    
+
     # Log current status for debugging (only on status changes or errors)
     if job.status in [JobStatus.SUCCEEDED, JobStatus.FAILED]:
         logger.info(f"[JOB {job_id}] Returning final status: {job.status}")
-    
-    # Optional: Clean up expired jobs (could be a separate background task)
-    if job.expires_at < datetime.utcnow():
-        logger.warning(f"[JOB {job_id}] Job has expired")
-        del _jobs[job_id]
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail={"message": f"Visualization job '{job_id}' has expired and was removed."},
-        )
 
-    return VisualizationJobStatusResponse(
-        job_id=job.id,
-        status=job.status,
-        visualization_type=job.visualization_type,
-        content=job.content,
-        metadata=job.metadata,
-        error=job.error,
+    return _json_response(
+        VisualizationJobStatusResponse(
+            job_id=job.id,
+            status=job.status,
+            visualization_type=job.visualization_type,
+            content=job.content,
+            metadata=job.metadata,
+            error=job.error,
+        )
     )
\ No newline at end of file
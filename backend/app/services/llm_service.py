@@ -1,29 +1,27 @@
+import asyncio
+import functools
+import hashlib
 import json
 import logging
-from typing import List
+from typing import Dict, List
 
-from google import genai
+from cachetools import TTLCache
 from google.genai import types, errors
 
+from app.core.breaker import CircuitOpenError, gemini_breaker
 from app.core.config import settings
 
-# Configure logging to show INFO level logs
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-
 logger = logging.getLogger(__name__)
+from app.core.gemini_client import get_client
 from .visualizations.visualization_factory import visualization_factory
 from .visualizations.visualization_strategy import VisualizationOptions, VisualizationResult
 
-# Create Google Gemini client
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
-
 
 async def check_gemini_connection():
     """Simple health check to verify API key works."""
     try:
         logger.info("Testing Gemini API connection...")
-        response = await client.aio.models.generate_content(
+        response = await get_client().aio.models.generate_content(
             model=settings.GEMINI_MODEL,
             contents="Reply with only the word 'OK'.",
         )
@@ -37,7 +35,7 @@ async def check_gemini_connection():
 async def list_models():
     """Lists available Gemini models."""
     try:
-        models_response = await client.aio.models.list()
+        models_response = await get_client().aio.models.list()
         models = [m for m in models_response if hasattr(m, 'supported_generation_methods') 
                   and 'generateContent' in m.supported_generation_methods]
         return models
@@ -45,6 +43,24 @@ async def list_models():
         return f"Error: {str(e)}"
 
 
+# Identical requests within the TTL window skip the Gemini round-trip
+# entirely; the per-key locks coalesce concurrent identical requests so only
+# one of them actually hits the API.
+_response_cache: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+_inflight_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _cache_key(question: str, visualization_type: str, options: VisualizationOptions) -> str:
+    # Every option that changes the generated output must be part of the key,
+    # otherwise e.g. a max_depth=2 request could be served a cached depth-6
+    # result for the same question.
+    raw = (
+        f"{visualization_type}|{options.complexity}|{options.max_depth}"
+        f"|{options.style}|{question.strip().lower()}"
+    )
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
 async def generate_visualization(
     question: str,
     visualization_type: str,
@@ -52,21 +68,63 @@ async def generate_visualization(
 ) -> VisualizationResult:
     """
     Generates a visualization using the appropriate strategy.
+
+    Successful results are cached for an hour keyed on the request shape, so
+    repeats of the same question are served without calling Gemini.
     """
-    try:
-        strategy = visualization_factory.create_strategy(visualization_type)
-        result = await strategy.generate(question, options)
-        return result
-    except ValueError as e:
-        # Catch specific strategy-related validation errors or unsupported types
-        raise ValueError(f"Visualization error: {e}") from e
-    except Exception as e:
-        # Catch all other unexpected errors
-        raise RuntimeError(f"Failed to generate visualization of type '{visualization_type}': {e}") from e
+    key = _cache_key(question, visualization_type, options)
+    cached = _response_cache.get(key)
+    if cached is not None:
+        logger.info(f"Serving cached {visualization_type} visualization (key={key})")
+        return cached
+
+    # Fail fast while Gemini is known to be down instead of tying up a worker
+    # in the full retry/backoff cycle.
+    if gemini_breaker.is_open:
+        raise CircuitOpenError("Gemini is temporarily unavailable (circuit open).")
+
+    lock = _inflight_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        # Another coroutine may have populated the cache while we waited.
+        cached = _response_cache.get(key)
+        if cached is not None:
+            return cached
+        try:
+            strategy = visualization_factory.create_strategy(visualization_type)
+            result = await strategy.generate(question, options)
+            gemini_breaker.record_success()
+            _response_cache[key] = result
+            return result
+        except ValueError as e:
+            # Catch specific strategy-related validation errors or unsupported types
+            raise ValueError(f"Visualization error: {e}") from e
+        except errors.ServerError:
+            # Transient Gemini failure: feed the breaker and let the job-level
+            # retry logic decide what to do with it.
+            gemini_breaker.record_failure()
+            raise
+        except Exception as e:
+            # Catch all other unexpected errors
+            raise RuntimeError(f"Failed to generate visualization of type '{visualization_type}': {e}") from e
+        finally:
+            _inflight_locks.pop(key, None)
+
+
+@functools.lru_cache(maxsize=1)
+def _supported_types() -> frozenset:
+    """Cached set of supported types; the registry never changes at runtime."""
+    return frozenset(visualization_factory.get_supported_types())
 
 
 def get_supported_visualization_types() -> List[str]:
     """
     Returns a list of all supported visualization types from the factory.
     """
-    return visualization_factory.get_supported_types()
+    return list(_supported_types())
+
+
+def is_supported_visualization_type(name: str) -> bool:
+    """
+    Checks whether the given visualization type is supported (case-insensitive).
+    """
+    return name.lower() in _supported_types()
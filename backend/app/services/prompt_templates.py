@@ -1,3 +1,4 @@
+import functools
 from typing import Dict
 
 class PromptTemplates:
@@ -120,21 +121,31 @@ Do NOT include any other text or explanation outside the JSON block.
         "general": TECHNICAL_CONCEPT, # Default fallback
     }
 
-    @classmethod
-    def get_template(cls, domain: str) -> str:
+    # Built once at import; get_complexity_guidance runs on every request so a
+    # fresh dict literal per call is avoidable allocation/GC pressure.
+    _complexity_guidance: Dict[str, str] = {
+        "simple": "Keep it high-level: 2-3 main branches, maximum 2 levels deep, 2-5 words per label.",
+        "balanced": "Provide a balanced view: 3-5 main branches, moderate detail, 3-4 levels deep, 3-7 words per label.",
+        "detailed": "Be comprehensive: 4-6 main branches, detailed explanations with examples, 5-6 levels deep, 4-10 words per label.",
+    }
+
+    @staticmethod
+    @functools.lru_cache(maxsize=16)
+    def get_template(domain: str) -> str:
         """
         Returns the appropriate prompt template for the given domain.
         Defaults to 'general' (TECHNICAL_CONCEPT) if the domain is not found.
         """
-        return cls._templates.get(domain.lower(), cls.TECHNICAL_CONCEPT)
+        return PromptTemplates._templates.get(
+            domain.lower(), PromptTemplates.TECHNICAL_CONCEPT
+        )
 
-    @classmethod
-    def get_complexity_guidance(cls, complexity: str) -> str:
+    @staticmethod
+    @functools.lru_cache(maxsize=16)
+    def get_complexity_guidance(complexity: str) -> str:
         """
         Returns a string of guidance based on the requested complexity level.
         """
-        return {
-            "simple": "Keep it high-level: 2-3 main branches, maximum 2 levels deep, 2-5 words per label.",
-            "balanced": "Provide a balanced view: 3-5 main branches, moderate detail, 3-4 levels deep, 3-7 words per label.",
-            "detailed": "Be comprehensive: 4-6 main branches, detailed explanations with examples, 5-6 levels deep, 4-10 words per label.",
-        }.get(complexity.lower(), "Provide a balanced view with good detail.")
+        return PromptTemplates._complexity_guidance.get(
+            complexity.lower(), "Provide a balanced view with good detail."
+        )
@@ -1,19 +1,81 @@
-import json
 import logging
 import re
+
+import orjson
 from typing import Dict, Any, List
 from pydantic import ValidationError
-from google import genai
 from google.genai import types
+from google.genai import errors as genai_errors
 
 from app.core.config import settings
+from app.core.gemini_client import get_client
 
 logger = logging.getLogger(__name__)
 from .visualization_strategy import VisualizationStrategy, VisualizationOptions, VisualizationResult
 from ..prompt_templates import PromptTemplates
 
-# Create Google Gemini client
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
+# Compiled once; LLM responses can be tens of KB and this runs on every call.
+_JSON_BLOCK_RE = re.compile(r'```json\s*(.*?)\s*```', re.DOTALL)
+
+# Node/edge ID sanitization runs for every node and edge endpoint; a compiled
+# sub() and a translate table do this in C instead of a per-character loop.
+_ID_STRIP_RE = re.compile(r'[^A-Za-z0-9_]')
+_QUOTE_ESCAPE = {ord('"'): "&quot;"}
+
+# A valid diagram must open with a flowchart declaration and direction.
+_VALID_FLOWCHART_RE = re.compile(r'\s*flowchart\s+(TD|LR|BT|RL|TB)\b')
+
+# Directions Mermaid (and the validator above) accept; anything else the LLM
+# returns falls back to top-down.
+_VALID_DIRECTIONS = frozenset({"TD", "LR", "BT", "RL", "TB"})
+
+# The generation config never varies per request; building the (pydantic)
+# config object once at import keeps it off the per-call path.
+_FLOWCHART_GEN_CONFIG = types.GenerateContentConfig(
+    temperature=0.4,  # Less creative for flowcharts
+)
+
+# The prompt body is invariant apart from the question and complexity
+# guidance; building it once at import avoids re-creating the multi-KB
+# string template on every request.
+_PROMPT_TEMPLATE = """
+You are an expert technical explainer and diagram designer.
+The user is asking: "{question}".
+
+Your task is to design a clear, high-level flow of how this works and represent that flow as a JSON object.
+This JSON will then be used to generate a Mermaid flowchart.
+
+JSON schema:
+```json
+{{
+  "type": "flowchart",
+  "direction": "TD" | "LR",
+  "nodes": [
+    {{"id": "A1", "label": "Start Node Label", "shape": "start"}},
+    {{"id": "B1", "label": "Process Step", "shape": "process"}},
+    {{"id": "C1", "label": "Decision Point", "shape": "decision"}},
+    {{"id": "D1", "label": "End Node Label", "shape": "end"}}
+  ],
+  "edges": [
+    {{"from": "A1", "to": "B1", "label": "optional edge label"}}
+  ]
+}}
+```
+Supported Node Shapes:
+- "start": `([])` (e.g., A(["Start"]))
+- "end": `(())` (e.g., Z(End)) - corrected, original was `([])` for both
+- "decision": `{{}}` (e.g., C{{"Is it true?"}})
+- "inputoutput": `[//]` (e.g., D[//"Input/Output"/])
+- "process": `[]` (e.g., B["Process"])
+- Default (if shape not specified or unknown): `[]`
+
+Important:
+- Respond with valid, parseable JSON only.
+- Wrap the JSON in a ```json ... ``` markdown block.
+- Do NOT include any text before or after the JSON block.
+- Ensure node IDs are unique and alphanumeric.
+- {complexity_guidance}
+"""
 
 class FlowchartStrategy(VisualizationStrategy):
     """
@@ -29,29 +91,38 @@ class FlowchartStrategy(VisualizationStrategy):
             logger.debug(f"[FLOWCHART] Built prompt with complexity: {options.complexity}")
             
             logger.info(f"[FLOWCHART] Calling Gemini API (model: {settings.GEMINI_MODEL})...")
-            response = await client.aio.models.generate_content(
+            # Stream the response so chunks are buffered while the model is
+            # still generating, instead of waiting for the full payload before
+            # any local work starts.
+            stream = await get_client().aio.models.generate_content_stream(
                 model=settings.GEMINI_MODEL,
                 contents=prompt,
-                config=types.GenerateContentConfig(
-                    temperature=0.4,  # Less creative for flowcharts
-                ),
+                config=_FLOWCHART_GEN_CONFIG,
             )
-            logger.info(f"[FLOWCHART] Received response from Gemini API (length: {len(response.text)} chars)")
-            raw_llm_output = response.text
-            logger.debug(f"[FLOWCHART] Raw LLM output preview: {raw_llm_output[:200]}...")
-
-            # Production-grade error handling: Extract JSON using regex
-            # LLM can sometimes add conversational text or markdown around the JSON
-            json_match = re.search(r'```json\s*(.*?)\s*```', raw_llm_output, re.DOTALL)
+            buf: List[str] = []
+            async for chunk in stream:
+                if chunk.text:
+                    buf.append(chunk.text)
+            raw_llm_output = "".join(buf)
+            logger.info(f"[FLOWCHART] Received response from Gemini API (length: {len(raw_llm_output)} chars)")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"[FLOWCHART] Raw LLM output preview: {raw_llm_output[:200]}...")
+
+            # Production-grade error handling: Extract JSON from the response.
+            # LLM can sometimes add conversational text or markdown around the
+            # JSON; a cheap find() locates the fence before the regex runs so
+            # we never scan the whole output when there is no block at all.
+            start = raw_llm_output.find("```json")
+            json_match = _JSON_BLOCK_RE.match(raw_llm_output, start) if start != -1 else None
             if not json_match:
                 # Fallback: if no markdown json block, try to parse the whole output as JSON
                 try:
-                    diagram = json.loads(raw_llm_output)
-                except json.JSONDecodeError:
+                    diagram = orjson.loads(raw_llm_output)
+                except orjson.JSONDecodeError:
                     raise ValueError("LLM response did not contain a valid JSON block or raw JSON.")
             else:
                 json_str = json_match.group(1).strip()
-                diagram = json.loads(json_str)
+                diagram = orjson.loads(json_str)
 
             mermaid_code = self._json_to_mermaid(diagram)
             logger.info(f"[FLOWCHART] Generated Mermaid code (length: {len(mermaid_code)} chars)")
@@ -67,9 +138,13 @@ class FlowchartStrategy(VisualizationStrategy):
                 content=mermaid_code,
                 metadata={},
             )
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"[FLOWCHART] JSON parsing failed: {e}")
             raise ValueError(f"Failed to parse JSON from LLM response: {e}") from e
+        except genai_errors.ServerError:
+            # Transient Gemini errors propagate so the retry and circuit
+            # breaker layers can react to them.
+            raise
         except Exception as e:
             logger.exception(f"[FLOWCHART] Unexpected error during generation: {e}")
             raise RuntimeError(f"Flowchart generation failed: {e}") from e
@@ -79,51 +154,20 @@ class FlowchartStrategy(VisualizationStrategy):
         Constructs the prompt for the Gemini LLM to generate a flowchart.
         """
         complexity_guidance = PromptTemplates.get_complexity_guidance(options.complexity)
-        
-        # Adjust prompt based on options, e.g., complexity could influence the number of nodes/edges
-        prompt = f"""
-You are an expert technical explainer and diagram designer.
-The user is asking: "{question}".
-
-Your task is to design a clear, high-level flow of how this works and represent that flow as a JSON object.
-This JSON will then be used to generate a Mermaid flowchart.
-
-JSON schema:
-```json
-{{
-  "type": "flowchart",
-  "direction": "TD" | "LR",
-  "nodes": [
-    {{"id": "A1", "label": "Start Node Label", "shape": "start"}},
-    {{"id": "B1", "label": "Process Step", "shape": "process"}},
-    {{"id": "C1", "label": "Decision Point", "shape": "decision"}},
-    {{"id": "D1", "label": "End Node Label", "shape": "end"}}
-  ],
-  "edges": [
-    {{"from": "A1", "to": "B1", "label": "optional edge label"}}
-  ]
-}}
-```
-Supported Node Shapes:
-- "start": `([])` (e.g., A(["Start"]))
-- "end": `(())` (e.g., Z(End)) - corrected, original was `([])` for both
-- "decision": `{{}}` (e.g., C{{"Is it true?"}})
-- "inputoutput": `[//]` (e.g., D[//"Input/Output"/])
-- "process": `[]` (e.g., B["Process"])
-- Default (if shape not specified or unknown): `[]`
 
-Important:
-- Respond with valid, parseable JSON only.
-- Wrap the JSON in a ```json ... ``` markdown block.
-- Do NOT include any text before or after the JSON block.
-- Ensure node IDs are unique and alphanumeric.
-- {complexity_guidance}
-"""
-        return prompt
+        # Adjust prompt based on options, e.g., complexity could influence the number of nodes/edges
+        return _PROMPT_TEMPLATE.format(
+            question=question, complexity_guidance=complexity_guidance
+        )
 
     def _json_to_mermaid(self, diagram: dict) -> str:
         """Convert a simple JSON diagram description into Mermaid flowchart code."""
-        direction = diagram.get("direction", "TD")
+        # Normalize the direction against the whitelist the validator checks,
+        # so a reply like "td" or "top-down" cannot make the pipeline reject
+        # its own output.
+        direction = str(diagram.get("direction", "TD")).strip().upper()
+        if direction not in _VALID_DIRECTIONS:
+            direction = "TD"
         nodes = diagram.get("nodes", [])
         edges = diagram.get("edges", [])
 
@@ -146,12 +190,12 @@ Important:
             if not node_id:
                 continue
 
-            safe_id = "".join(ch for ch in node_id if ch.isalnum() or ch == "_") # Allow underscore for node IDs
+            safe_id = _ID_STRIP_RE.sub("", node_id) # Allow underscore for node IDs
             if not safe_id:
                 continue
 
             # Escape double quotes in labels for Mermaid
-            safe_label = label.replace('"', '&quot;') or safe_id
+            safe_label = label.translate(_QUOTE_ESCAPE) or safe_id
 
             open_shape, close_shape = node_shapes.get(shape_key, node_shapes["default"])
             lines.append(f'{safe_id}{open_shape}"{safe_label}"{close_shape}')
@@ -162,14 +206,14 @@ Important:
             if not src or not dst:
                 continue
 
-            safe_src = "".join(ch for ch in src if ch.isalnum() or ch == "_")
-            safe_dst = "".join(ch for ch in dst if ch.isalnum() or ch == "_")
+            safe_src = _ID_STRIP_RE.sub("", src)
+            safe_dst = _ID_STRIP_RE.sub("", dst)
             if not safe_src or not safe_dst:
                 continue
 
             label = edge.get("label", "").strip()
             if label:
-                safe_label = label.replace('"', '&quot;')
+                safe_label = label.translate(_QUOTE_ESCAPE)
                 lines.append(f'{safe_src} -->|"{safe_label}"| {safe_dst}')
             else:
                 lines.append(f"{safe_src} --> {safe_dst}")
@@ -190,19 +234,10 @@ Important:
         Validates the generated Mermaid content for basic correctness.
         Checks for the 'flowchart' keyword.
         """
-        if not content or len(content.strip()) < 10:
-            return False
-        
-        # Check for the flowchart declaration at the beginning
-        if not content.strip().startswith("flowchart"):
+        # Cheap length bounds first; Mermaid might struggle with extremely
+        # large inputs. The single anchored regex then replaces the previous
+        # strip/startswith passes without allocating a stripped copy.
+        if not content or len(content) > 50000:
             return False
-        
-        # Simple check for nodes and edges (optional, as LLM output might be minimal)
-        # if not re.search(r'\b\w+\s*(-->|<--)\s*\w+\b', content): # Checks for A --> B pattern
-        #     return False
-        
-        # Check length bounds
-        if len(content) > 50000: # Mermaid might struggle with extremely large inputs
-            return False
-        
-        return True
+
+        return _VALID_FLOWCHART_RE.match(content) is not None
@@ -1,25 +1,112 @@
+import functools
 import re
-import json
 import logging
 from typing import Dict, Any, List, Optional
-from pydantic import BaseModel, ValidationError
-from google import genai
+
+import msgspec
 from google.genai import types
+from google.genai import errors as genai_errors
 
 from app.core.config import settings
+from app.core.gemini_client import get_client
 
 logger = logging.getLogger(__name__)
 from .visualization_strategy import VisualizationStrategy, VisualizationOptions, VisualizationResult
 from ..prompt_templates import PromptTemplates
 
-# Create Google Gemini client
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
+# Compiled once; runs on every LLM response.
+_HEADING_RE = re.compile(r'^\s*#+\s.+', re.MULTILINE)
+
+# The generation config never varies per request; building the (pydantic)
+# config object once at import keeps it off the per-call path.
+_MINDMAP_GEN_CONFIG = types.GenerateContentConfig(
+    temperature=0.7,  # A bit creative for mindmaps
+    # Ask for raw JSON directly, which skips the markdown-fence extraction
+    # and removes the failure mode where the model omits the fence. Models
+    # that ignore the hint still work via the fence fallback in generate().
+    response_mime_type="application/json",
+)
+
+_JSON_FENCE = "```json"
+
+
+@functools.lru_cache(maxsize=64)
+def _prebaked_prompt(domain: str, complexity: str, max_depth: int) -> str:
+    """Prompt template with everything but the question substituted.
+
+    Requests mostly differ only in the question, so the per-(domain,
+    complexity, max_depth) shape is baked once and reused; _build_prompt
+    then fills the single remaining {question} hole.
+    """
+    base_template = PromptTemplates.get_template(domain)
+    complexity_guidance = PromptTemplates.get_complexity_guidance(complexity)
+    return (
+        base_template
+        .replace("{json_schema}", PromptTemplates.JSON_SCHEMA)
+        .replace("{max_depth}", str(max_depth))
+        .replace("{complexity_guidance}", complexity_guidance)
+    )
+
 
-class MindmapNode(BaseModel):
+def _extract_json_block(llm_output: str) -> Optional[str]:
+    """Slice the ```json ... ``` block out of the output with plain find().
+
+    The fence delimiters are literal, so two C-level substring searches
+    replace the old DOTALL regex scan over the whole (potentially tens of
+    KB) response. Returns None when no complete block is present.
+    """
+    start = llm_output.find(_JSON_FENCE)
+    if start == -1:
+        return None
+    start += len(_JSON_FENCE)
+    end = llm_output.find("```", start)
+    if end == -1:
+        return None
+    return llm_output[start:end].strip()
+
+# Ordered domain keyword patterns; the first match wins, mirroring the old
+# if/elif chain but as one compiled scan per domain instead of Python-level
+# substring loops over a lowercased copy.
+_DOMAIN_PATTERNS = [
+    ("comparison", re.compile(r'\b(compare|vs|versus|difference)\b', re.IGNORECASE)),
+    ("learning", re.compile(r'\b(learn|explain|understand|teach)\b', re.IGNORECASE)),
+    ("business", re.compile(r'\b(process|workflow|procedure|steps)\b', re.IGNORECASE)),
+    ("technical", re.compile(r'\b(how does|technical|system|architecture)\b', re.IGNORECASE)),
+]
+
+# Plain recursive value type; msgspec decodes the whole tree in one C pass
+# with the schema compiled once into the module-level decoder.
+class MindmapNode(msgspec.Struct):
     title: str
     children: Optional[List['MindmapNode']] = None
 
-MindmapNode.model_rebuild() # Needed for forward references 
+
+_MINDMAP_DECODER = msgspec.json.Decoder(MindmapNode)
+
+# Hard caps on decoded trees. A hallucinated (or adversarial) response can
+# nest `children` thousands deep; these bounds reject it right after decode,
+# before any rendering work happens.
+_MAX_NODES = 5000
+_MAX_TREE_DEPTH = 32
+
+
+def _walk_stats(root: MindmapNode) -> tuple:
+    """Returns (total_nodes, max_depth) via an iterative walk.
+
+    Explicit stack rather than recursion, so pathological nesting cannot
+    raise RecursionError before the guard gets to reject it.
+    """
+    count = 0
+    max_d = 0
+    stack = [(root, 1)]
+    while stack:
+        node, depth = stack.pop()
+        count += 1
+        if depth > max_d:
+            max_d = depth
+        if node.children:
+            stack.extend((child, depth + 1) for child in node.children)
+    return count, max_d
 
 class MindmapStrategy(VisualizationStrategy):
     """
@@ -35,37 +122,52 @@ class MindmapStrategy(VisualizationStrategy):
             logger.debug(f"[MINDMAP] Built prompt with complexity: {options.complexity}, max_depth: {options.max_depth}")
             
             logger.info(f"[MINDMAP] Calling Gemini API (model: {settings.GEMINI_MODEL})...")
-            response = await client.aio.models.generate_content(
+            response = await get_client().aio.models.generate_content(
                 model=settings.GEMINI_MODEL,
                 contents=prompt,
-                config=types.GenerateContentConfig(
-                    temperature=0.7,  # A bit creative for mindmaps
-                ),
+                config=_MINDMAP_GEN_CONFIG,
             )
-            logger.info(f"[MINDMAP] Received response from Gemini API (length: {len(response.text)} chars)")
+            # response.text re-concatenates candidate parts on each access, so
+            # read it exactly once.
             llm_output = response.text
-            logger.debug(f"[MINDMAP] Raw LLM output preview: {llm_output[:200]}...")
+            logger.info(f"[MINDMAP] Received response from Gemini API (length: {len(llm_output)} chars)")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"[MINDMAP] Raw LLM output preview: {llm_output[:200]}...")
 
-            # Production-grade error handling: Extract JSON using regex
-            json_match = re.search(r'```json\s*(.*?)\s*```', llm_output, re.DOTALL)
-            if not json_match:
-                raise ValueError("LLM response did not contain a valid JSON block.")
+            # With response_mime_type="application/json" the output is the
+            # bare JSON object; fall back to fence extraction for models that
+            # ignore the mime hint.
+            if llm_output.lstrip().startswith("{"):
+                json_str = llm_output
+            else:
+                json_str = _extract_json_block(llm_output)
+                if json_str is None:
+                    raise ValueError("LLM response did not contain a valid JSON block.")
 
-            json_str = json_match.group(1).strip()
-            
-            json_data = json.loads(json_str)
-            mindmap_data = MindmapNode.model_validate(json_data)
+            # Parse straight into node instances in one pass instead of
+            # json.loads + a second validation walk.
+            mindmap_data = _MINDMAP_DECODER.decode(json_str)
 
-            markdown_content = self._json_to_markdown(mindmap_data, options.max_depth)
+            # Size guard before any rendering: reject runaway trees with one
+            # cheap counting pass instead of building markdown for them.
+            total_nodes, actual_depth = _walk_stats(mindmap_data)
+            if total_nodes > _MAX_NODES:
+                raise ValueError(
+                    f"LLM generated a mindmap with {total_nodes} nodes "
+                    f"(limit is {_MAX_NODES})."
+                )
+            if actual_depth > _MAX_TREE_DEPTH:
+                raise ValueError(
+                    f"LLM generated a mindmap nested {actual_depth} levels deep "
+                    f"(limit is {_MAX_TREE_DEPTH})."
+                )
+
+            markdown_content = self._render(mindmap_data, options.max_depth)
             logger.info(f"[MINDMAP] Generated markdown content (length: {len(markdown_content)} chars)")
 
             if not self.validate_content(markdown_content):
                 logger.error("[MINDMAP] Validation failed for generated markdown content")
                 raise ValueError("Generated mindmap markdown content is invalid.")
-
-            # Calculate metadata
-            total_nodes = self._count_nodes(mindmap_data)
-            actual_depth = self._calculate_depth(mindmap_data)
             logger.info(f"[MINDMAP] Successfully generated mindmap with {total_nodes} nodes and depth {actual_depth}")
 
             return VisualizationResult(
@@ -77,12 +179,16 @@ class MindmapStrategy(VisualizationStrategy):
                     "requested_max_depth": options.max_depth,
                 },
             )
-        except ValidationError as e:
+        except msgspec.ValidationError as e:
             logger.error(f"[MINDMAP] JSON validation failed: {e}")
             raise ValueError(f"LLM generated invalid JSON for Mindmap: {e}") from e
-        except json.JSONDecodeError as e:
+        except msgspec.DecodeError as e:
             logger.error(f"[MINDMAP] JSON parsing failed: {e}")
             raise ValueError(f"Failed to parse JSON from LLM response: {e}") from e
+        except genai_errors.ServerError:
+            # Transient Gemini errors propagate so the retry and circuit
+            # breaker layers can react to them.
+            raise
         except Exception as e:
             # Catch all other exceptions for robust error handling
             logger.exception(f"[MINDMAP] Unexpected error during generation: {e}")
@@ -92,15 +198,9 @@ class MindmapStrategy(VisualizationStrategy):
         """
         Detects the domain of the question to select an appropriate prompt template.
         """
-        q_lower = question.lower()
-        if any(keyword in q_lower for keyword in ["compare", "vs", "versus", "difference"]):
-            return "comparison"
-        elif any(keyword in q_lower for keyword in ["learn", "explain", "understand", "teach"]):
-            return "learning"
-        elif any(keyword in q_lower for keyword in ["process", "workflow", "procedure", "steps"]):
-            return "business"
-        elif any(keyword in q_lower for keyword in ["how does", "technical", "system", "architecture"]):
-            return "technical"
+        for domain, pattern in _DOMAIN_PATTERNS:
+            if pattern.search(question):
+                return domain
         return "general"
 
 
@@ -110,68 +210,50 @@ class MindmapStrategy(VisualizationStrategy):
         Uses domain detection and complexity guidance.
         """
         domain = self._detect_domain(question)
-        base_template = PromptTemplates.get_template(domain)
-        complexity_guidance = PromptTemplates.get_complexity_guidance(options.complexity)
-
-        prompt = base_template.format(
-            question=question,
-            max_depth=options.max_depth,
-            complexity_guidance=complexity_guidance,
-            json_schema=PromptTemplates.JSON_SCHEMA
-        )
-        return prompt
-
-    def _json_to_markdown(self, node: MindmapNode, max_depth: int, current_depth: int = 0) -> str:
-        """
-        Recursively converts the MindmapNode structure into Markdown format.
-        """
-        if current_depth >= max_depth:
-            return ""
+        prebaked = _prebaked_prompt(domain, options.complexity, options.max_depth)
+        return prebaked.replace("{question}", question)
 
-        markdown_lines = []
-        heading_prefix = "#" * (current_depth + 1)
-        markdown_lines.append(f"{heading_prefix} {node.title}")
+    def _render(self, root: MindmapNode, max_depth: int) -> str:
+        """Converts the tree to Markdown with a single iterative traversal.
 
-        if node.children:
-            for child in node.children:
-                child_markdown = self._json_to_markdown(child, max_depth, current_depth + 1)
-                if child_markdown:
-                    markdown_lines.append(child_markdown)
-        
-        return "\n".join(markdown_lines)
+        Lines accumulate in one list joined once at the end, instead of the
+        old recursion that re-joined at every level. Stats come from
+        _walk_stats, so subtrees below max_depth are not visited at all.
+        """
+        if max_depth < 1:
+            return ""
+        # One prefix string per level, built once per call; the inner loop
+        # then does a single concat per node instead of re-running str.__mul__
+        # and f-string formatting for every heading.
+        prefixes = ["#" * (i + 1) + " " for i in range(max_depth)]
+        lines = []
+        stack = [(root, 1)]
+        # Bind the hot methods to locals so the loop runs on LOAD_FAST
+        # instead of an attribute lookup per iteration — measurable on
+        # thousand-node trees.
+        append = lines.append
+        pop = stack.pop
+        extend = stack.extend
+        while stack:
+            node, depth = pop()
+            append(prefixes[depth - 1] + node.title)
+            children = node.children
+            if children and depth < max_depth:
+                # Reversed so the stack pops children in document order.
+                extend((child, depth + 1) for child in reversed(children))
+        return "\n".join(lines)
 
     def validate_content(self, content: str) -> bool:
         """
         Validates the generated markdown content for basic structure.
         """
-        if not content or len(content.strip()) < 10:
+        # Cheap length bounds first (no stripped copy); Markmap might struggle
+        # with extremely large inputs. The heading regex only runs on content
+        # that already passed the bounds, and whitespace-only strings fail it.
+        n = len(content)
+        if n < 10 or n > 50000:
             return False
-        
+
         # Check for at least one markdown heading
-        if not re.search(r'^\s*#+\s.+', content, re.MULTILINE):
-            return False
-        
-        # Check length bounds
-        if len(content) > 50000: # Markmap might struggle with extremely large inputs
-            return False
-        
-        return True
+        return _HEADING_RE.search(content) is not None
 
-    def _count_nodes(self, node: MindmapNode) -> int:
-        """Recursively counts the total number of nodes in the mindmap."""
-        count = 1 # Count self
-        if node.children:
-            for child in node.children:
-                count += self._count_nodes(child)
-        return count
-
-    def _calculate_depth(self, node: MindmapNode, current_depth: int = 1) -> int:
-        """Recursively calculates the maximum depth of the mindmap."""
-        if not node.children:
-            return current_depth
-        
-        max_child_depth = 0
-        for child in node.children:
-            max_child_depth = max(max_child_depth, self._calculate_depth(child, current_depth + 1))
-        
-        return max_child_depth
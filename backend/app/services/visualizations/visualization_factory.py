@@ -1,39 +1,75 @@
-from typing import Dict, Type, List
+import importlib
+from typing import Dict, List, Type, Union
 
 from .visualization_strategy import VisualizationStrategy
-from .flowchart_strategy import FlowchartStrategy
-from .mindmap_strategy import MindmapStrategy
 
 class VisualizationFactory:
     """
     Factory for creating instances of VisualizationStrategy based on type.
+
+    Strategies are registered as "module:ClassName" paths and imported on
+    first use, so importing the factory (and everything that transitively
+    imports it) does not pull in the strategy modules and their heavy
+    dependencies at cold start.
     """
-    _strategies: Dict[str, Type[VisualizationStrategy]] = {}
+    _strategies: Dict[str, Union[str, Type[VisualizationStrategy]]] = {}
 
     def __init__(self):
+        # Lazily-built singleton instances; strategies are stateless (generate
+        # takes all per-request state as arguments), so one instance per type
+        # can safely serve every request.
+        self._instances: Dict[str, VisualizationStrategy] = {}
         # Register strategies upon factory initialization
-        self.register_strategy("flowchart", FlowchartStrategy)
-        self.register_strategy("mindmap", MindmapStrategy)
+        self.register_strategy(
+            "flowchart",
+            "app.services.visualizations.flowchart_strategy:FlowchartStrategy",
+        )
+        self.register_strategy(
+            "mindmap",
+            "app.services.visualizations.mindmap_strategy:MindmapStrategy",
+        )
 
-    def register_strategy(self, type_name: str, strategy_class: Type[VisualizationStrategy]):
+    def register_strategy(
+        self,
+        type_name: str,
+        strategy: Union[str, Type[VisualizationStrategy]],
+    ):
         """
-        Registers a new visualization strategy with the factory.
+        Registers a new visualization strategy with the factory, either as a
+        class or as a lazy "module:ClassName" path.
         """
-        self._strategies[type_name.lower()] = strategy_class
+        key = type_name.lower()
+        self._strategies[key] = strategy
+        self._instances.pop(key, None)
+
+    def _resolve_class(self, key: str) -> Type[VisualizationStrategy]:
+        """Import a lazily-registered strategy class, caching the result."""
+        entry = self._strategies[key]
+        if isinstance(entry, str):
+            module_name, class_name = entry.split(":")
+            entry = getattr(importlib.import_module(module_name), class_name)
+            self._strategies[key] = entry
+        return entry
 
     def create_strategy(self, type_name: str) -> VisualizationStrategy:
         """
-        Creates and returns an instance of the specified visualization strategy.
+        Returns the (cached) instance of the specified visualization strategy.
         Raises ValueError if the type is not supported.
         """
-        strategy_class = self._strategies.get(type_name.lower())
-        if not strategy_class:
+        key = type_name.lower()
+        instance = self._instances.get(key)
+        if instance is not None:
+            return instance
+
+        if key not in self._strategies:
             supported_types = ", ".join(self._strategies.keys())
             raise ValueError(
                 f"Unsupported visualization type: '{type_name}'. "
                 f"Supported types are: {supported_types}."
             )
-        return strategy_class()
+        instance = self._resolve_class(key)()
+        self._instances[key] = instance
+        return instance
 
     def get_supported_types(self) -> List[str]:
         """
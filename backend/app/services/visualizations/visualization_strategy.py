@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any
+
+import msgspec
 from pydantic import BaseModel, Field
 
 # 2.1 Define Base Strategy Interface
@@ -18,13 +20,18 @@ class VisualizationOptions(BaseModel):
         "default", description="Specific style or theme for the visualization"
     )
 
-class VisualizationResult(BaseModel):
+# A slotted Struct rather than a BaseModel: results are internal value
+# objects built by strategies and held in the response cache, so they never
+# need pydantic validation and the per-instance memory stays small.
+# (VisualizationOptions above must stay a BaseModel — FastAPI validates it
+# as part of the request body.)
+class VisualizationResult(msgspec.Struct, kw_only=True):
     """
     Standardized output for any visualization strategy.
     """
-    type: str = Field(..., description="Type of visualization (e.g., 'flowchart', 'mindmap')")
-    content: str = Field(..., description="The generated visualization code (e.g., Mermaid, Markdown)")
-    metadata: Dict[str, Any] = Field({}, description="Additional metadata about the visualization")
+    type: str
+    content: str
+    metadata: Dict[str, Any] = msgspec.field(default_factory=dict)
 
 class VisualizationStrategy(ABC):
     """